@@ -13,6 +13,7 @@
 # limitations under the License.
 
 
+import asyncio
 import logging
 import os
 
@@ -36,3 +37,12 @@ genai_client = genai.Client(
 
 root_agent = order_flow_agent.create_agent(
     genai_client=genai_client)
+
+# Warm up the model connections when loaded from a running event loop, as
+# adk web does. The connections belong to that loop, so nothing is sent when
+# the module is imported without one (e.g. by deployment/deploy.py).
+try:
+    _warmup_task = asyncio.get_running_loop().create_task(
+        order_flow_agent.warmup(root_agent))
+except RuntimeError:
+    _warmup_task = None
@@ -0,0 +1,187 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import weakref
+
+from typing import Optional
+
+from google.adk.agents.callback_context import CallbackContext
+from google.adk.models.llm_request import LlmRequest
+from google.adk.models.llm_response import LlmResponse
+from google.genai import types
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+_AGENT_RESPONSE_KEY = '"agent_response"'
+
+# The order itself is carried in the instructions, so the model only needs the
+# recent conversation. A turn adds about two contents (the user message and the
+# reply), so a trim leaves at least the last 5 turns. Older contents are dropped
+# _HISTORY_TRIM_STEP at a time rather than one turn per call, which keeps the
+# request prefix stable between trims for implicit caching; the window grows
+# back to about 10 turns before the next trim.
+_MAX_HISTORY_CONTENTS = 20
+_HISTORY_TRIM_STEP = 10
+
+
+def _decode_partial_string(text: str, start: int) -> str:
+  """Decodes the JSON string starting at text[start] as far as it is complete.
+
+  Stops before a trailing escape sequence that has not fully arrived yet, so
+  the decoded prefix only ever grows as more chunks are appended.
+  """
+  i = start
+  n = len(text)
+  while i < n:
+    char = text[i]
+    if char == '"':
+      break
+    if char != '\\':
+      i += 1
+      continue
+    if i + 1 >= n:
+      break
+    if text[i + 1] != 'u':
+      i += 2
+      continue
+    if i + 6 > n:
+      break
+    if 0xD800 <= int(text[i + 2:i + 6], 16) <= 0xDBFF:
+      # High surrogate: wait for the low surrogate that completes the pair.
+      if i + 12 > n:
+        break
+      i += 12
+    else:
+      i += 6
+  return json.loads('"' + text[start:i] + '"')
+
+
+def decode_agent_response(text: str) -> str:
+  """Returns the decoded prefix of `agent_response` in a partial JSON output.
+
+  Raises ValueError if the string contains a malformed escape sequence.
+  """
+  key = text.find(_AGENT_RESPONSE_KEY)
+  if key < 0:
+    return ""
+  colon = text.find(":", key + len(_AGENT_RESPONSE_KEY))
+  if colon < 0:
+    return ""
+  quote = text.find('"', colon + 1)
+  if quote < 0:
+    return ""
+  return _decode_partial_string(text, quote + 1)
+
+
+def model_content(text: str) -> types.Content:
+  """Builds the content of a text reply from the model."""
+  return types.Content(
+      role='model',
+      parts=[types.Part(text=text)],
+  )
+
+
+def response_text(llm_response: LlmResponse) -> str:
+  """Returns the text of a model response, leaving out thoughts.
+
+  Empty for responses without text. In SSE mode these follow the aggregated
+  response when the last chunk only carries a finish reason or usage metadata,
+  and the after_model_callback runs on them as well.
+  """
+  content = llm_response.content
+  if not content or not content.parts:
+    return ""
+  return "".join(
+      part.text for part in content.parts if part.text and not part.thought)
+
+
+def user_text(callback_context: CallbackContext) -> str:
+  """Returns the text of the user message that started this invocation."""
+  user_content = callback_context.user_content
+  if not user_content or not user_content.parts:
+    return ""
+  return "".join(part.text for part in user_content.parts if part.text).strip()
+
+
+def trim_history(
+  callback_context: CallbackContext,
+  llm_request: LlmRequest,
+) -> Optional[LlmResponse]:
+  """Limits the conversation history sent to the model."""
+  contents = llm_request.contents
+  excess = len(contents) - _MAX_HISTORY_CONTENTS
+  if excess <= 0:
+    return None
+  # The latest batch of user contents holds the current message and the
+  # per-turn instruction, so the cut never goes past the last model content.
+  last_model = next(
+      (i for i in range(len(contents) - 1, -1, -1)
+       if contents[i].role != 'user'),
+      None)
+  if last_model is None:
+    return None
+  cut = min(-(-excess // _HISTORY_TRIM_STEP) * _HISTORY_TRIM_STEP, last_model)
+  # Start the window on a user content.
+  start = next(
+      (i for i in range(cut, len(contents)) if contents[i].role == 'user'),
+      None)
+  if start is None:
+    return None
+  llm_request.contents = contents[start:]
+  return None
+
+
+class AgentResponseStreamer:
+  """Streams the `agent_response` field of the structured output.
+
+  In SSE streaming mode the model's JSON output arrives in chunks, and
+  after_model_callback runs once for every partial chunk before the final
+  aggregated response. This buffers the chunks of each invocation and rewrites
+  every partial response to carry only the newly decoded `agent_response`
+  text, so the user sees the reply while it is generated instead of raw JSON.
+  """
+
+  def __init__(self):
+    self._buffers: dict[str, tuple[str, int]] = {}
+
+  def __call__(
+    self,
+    callback_context: CallbackContext,
+    llm_response: LlmResponse,
+  ) -> LlmResponse:
+    key = callback_context.invocation_id
+    if key not in self._buffers:
+      # finish() is skipped when the stream is cancelled or fails, so the
+      # buffer is also dropped together with the invocation context.
+      weakref.finalize(
+          callback_context._invocation_context, self._buffers.pop, key, None)
+    text, emitted = self._buffers.get(key, ("", 0))
+    text += response_text(llm_response)
+    try:
+      agent_response = decode_agent_response(text)
+    except ValueError:
+      # A malformed escape sequence: emit nothing rather than fail the stream.
+      logger.warning("Could not decode the partial agent_response: %s", text)
+      agent_response = ""
+    self._buffers[key] = (text, max(emitted, len(agent_response)))
+
+    llm_response.content = model_content(agent_response[emitted:])
+    return llm_response
+
+  def finish(self, callback_context: CallbackContext):
+    """Drops the buffer once the final aggregated response arrives."""
+    self._buffers.pop(callback_context.invocation_id, None)
@@ -13,23 +13,32 @@
 # limitations under the License.
 
 
-from typing import Union
+import re
+
+from typing import Optional, Union
 
 from google.adk.agents.callback_context import CallbackContext
 from google.adk.agents import LlmAgent
 from google.adk.models.base_llm import BaseLlm
+from google.adk.models.llm_request import LlmRequest
 from google.adk.models.llm_response import LlmResponse
 from google.adk.planners.built_in_planner import BuiltInPlanner
 from google.genai import types
-from pydantic import BaseModel, ConfigDict, Field
+from pydantic import BaseModel, ConfigDict, Field, TypeAdapter
 
-from .. import constants
+from .. import callback_utils, constants
 
 import logging
 
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Whole-message answers to "Would that be all for today?" that need no model.
+_CONFIRM_PATTERN = re.compile(
+    r"(yes|yeah|yep|yup|sure|correct|confirm(ed)?|that['’]?s (it|all|right|correct))"
+    r",?( please| thanks| thank you)?[.!]*",
+    re.IGNORECASE)
+_REJECT_PATTERN = re.compile(r"(no|nope)[.!]*", re.IGNORECASE)
+
 
 class OutputSchema(BaseModel):
   """Output schema for the agent."""
@@ -37,29 +46,67 @@ class OutputSchema(BaseModel):
   order_confirmed: str = Field(description="true, if the user has confirmed, false, if the user wants to change the order. unknown if the user didn't respond yet.")
 
 
+_OUTPUT_ADAPTER = TypeAdapter(OutputSchema)
+
+
+class BeforeModelCallback:
+  def __call__(
+    self,
+    callback_context: CallbackContext,
+    llm_request: LlmRequest,
+  ) -> Optional[LlmResponse]:
+    """Handles plain yes/no answers to the confirmation question."""
+    state = callback_context.state
+    if state.get(constants.ORDER_STATUS) != constants.CONFIRMING:
+      # The order summary has not been presented yet.
+      return None
+    text = callback_utils.user_text(callback_context)
+    if _CONFIRM_PATTERN.fullmatch(text):
+      state[constants.ORDER_STATUS] = constants.CONFIRMED
+    elif _REJECT_PATTERN.fullmatch(text):
+      state[constants.ORDER_STATUS] = constants.IN_PROGRESS
+    else:
+      return None
+    llm_response = LlmResponse()
+    llm_response.content = callback_utils.model_content("")
+    return llm_response
+
+
 class AfterModelCallback:
+  def __init__(self):
+    self.streamer = callback_utils.AgentResponseStreamer()
+
   def __call__(
     self,
     callback_context: CallbackContext,
     llm_response: LlmResponse,
   ):
-    output = OutputSchema.model_validate_json(llm_response.content.parts[0].text)
-    logger.info(f"Model output: {output}")
+    if llm_response.partial:
+      return self.streamer(callback_context, llm_response)
+    self.streamer.finish(callback_context)
+
+    text = callback_utils.response_text(llm_response)
+    if not text:
+      return llm_response
+    output = _OUTPUT_ADAPTER.validate_json(text)
+    logger.info("Model output: %s", output)
 
     state = callback_context.state
-    if output.order_confirmed != "unknown":
-      if output.order_confirmed == "true":
-        state[constants.ORDER_STATUS] = constants.CONFIRMED
-      else:
-        state[constants.ORDER_STATUS] = constants.IN_PROGRESS
-
-    llm_response.content = types.Content(
-        role='model',
-        parts=[types.Part(text=output.agent_response)],
-    )
+    if output.order_confirmed == "unknown":
+      state[constants.ORDER_STATUS] = constants.CONFIRMING
+    elif output.order_confirmed == "true":
+      state[constants.ORDER_STATUS] = constants.CONFIRMED
+    else:
+      state[constants.ORDER_STATUS] = constants.IN_PROGRESS
+
+    llm_response.content = callback_utils.model_content(output.agent_response)
     return llm_response
 
 
+_before_model_callback = BeforeModelCallback()
+_after_model_callback = AfterModelCallback()
+
+
 class ConfirmationAgent(LlmAgent):
 
   def __init__(self, model: Union[str, BaseLlm], **kwargs):
@@ -72,48 +119,53 @@ class ConfirmationAgent(LlmAgent):
             include_thoughts=False
           )
       ),
+      static_instruction=types.Content(
+          role='user',
+          parts=[types.Part(text="""
+            You are confirmation_agent to help the user confirm the order.
+
+            You provide the brief summary of the items in the cart and ask if the order is correct.
+            If the user confirms the order, return an empty text for agent_response and set order_confirmed to true.
+            If the user wants to change the order or asks for correction, set order_confirmed to false.
+
+            <example>
+              Cart: < a) 1 dave's #1: 2 tenders with fries>
+              Output: {"agent_response": "Alright, <summary of items in cart and the total cost>. Would that be all for today?",
+                       "order_confirmed": "unknown"}
+            </example>
+            <example>
+              Cart: < a) 1 dave's #1: 2 tenders with fries>
+              Output: {"agent_response": "Alright, <summary of items in cart and the total cost>. Would that be all for today?",
+                       "order_confirmed": "unknown"}
+              User: that's it
+              Output: {"agent_response": "", "order_confirmed": "true"}
+            </example>
+            <example>
+              Cart: < a) 1 dave's #1: 2 tenders with fries>
+              Output: {"agent_response": "Alright, <summary of items in cart and the total cost>. Would that be all for today?",
+                       "order_confirmed": "unknown"}
+              User: no
+              Output: {"agent_response": "", "order_confirmed": "false"}
+            </example>
+            <example>
+              Cart: < a) 1 dave's #1: 2 tenders with fries>
+              Output: {"agent_response": "Alright, <summary of items in cart and the total cost>. Would that be all for today?",
+                       "order_confirmed": "unknown"}
+              User: Say that again?
+              Output: {"agent_response": "You ordered <summary of items in cart and the total cost>. Would that be all for today?",
+                       "order_confirmed": "unknown"}
+            </example>
+          """)],
+      ),
       instruction="""
-        You are confirmation_agent to help the user confirm the order.
-
-        You provide the brief summary of the items in the cart and ask if the order is correct.
-        If the user confirms the order, return an empty text for agent_response and set order_confirmed to true.
-        If the user wants to change the order or asks for correction, set order_confirmed to false.
-
         Current cart: {current_order?}
         Order total: ${order_total?}
-
-        <example>
-          Cart: < a) 1 dave's #1: 2 tenders with fries>
-          Output: {"agent_response": "Alright, <summary of items in cart and the total cost>. Would that be all for today?",
-                   "order_confirmed": "unknown"}
-        </example>
-        <example>
-          Cart: < a) 1 dave's #1: 2 tenders with fries>
-          Output: {"agent_response": "Alright, <summary of items in cart and the total cost>. Would that be all for today?",
-                   "order_confirmed": "unknown"}
-          User: that's it
-          Output: {"agent_response": "", "order_confirmed": "true"}
-        </example>
-        <example>
-          Cart: < a) 1 dave's #1: 2 tenders with fries>
-          Output: {"agent_response": "Alright, <summary of items in cart and the total cost>. Would that be all for today?",
-                   "order_confirmed": "unknown"}
-          User: no
-          Output: {"agent_response": "", "order_confirmed": "false"}
-        </example>
-        <example>
-          Cart: < a) 1 dave's #1: 2 tenders with fries>
-          Output: {"agent_response": "Alright, <summary of items in cart and the total cost>. Would that be all for today?",
-                   "order_confirmed": "unknown"}
-          User: Say that again?
-          Output: {"agent_response": "You ordered <summary of items in cart and the total cost>. Would that be all for today?",
-                   "order_confirmed": "unknown"}
-        </example>
       """,
       output_schema=OutputSchema,
       disallow_transfer_to_parent=True,
       disallow_transfer_to_peers=True,
-      after_model_callback=AfterModelCallback(),
+      before_model_callback=[_before_model_callback, callback_utils.trim_history],
+      after_model_callback=_after_model_callback,
     )
 
 
@@ -22,6 +22,7 @@ NAME_FOR_ORDER="name_for_order"
 CONFIRMED="confirmed"
 FINISHED="finished"
 IN_PROGRESS="in_progress"
+CONFIRMING="confirming"
 GETTING_USER_INFO="getting_user_info"
 
 # Agent names
@@ -23,7 +23,6 @@ from typing import AsyncGenerator, Callable
 from typing_extensions import override
 
 
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 _MAX_ITERATIONS = 30  # To prevent infinite loop.
@@ -36,7 +35,6 @@ class CustomWorkflowAgent(BaseAgent):
 
     agent_map: dict[str, LlmAgent] = {}
     get_next_agent: Callable
-    step: int = 0
 
     model_config = {"arbitrary_types_allowed": True}
 
@@ -67,20 +65,23 @@ class CustomWorkflowAgent(BaseAgent):
         """
         session_state = ctx.session.state
         selected_agent_name = self.get_next_agent(session_state)
-        while self.step < _MAX_ITERATIONS:
-            self.step += 1
-            
-            logger.info(f"Step {self.step}: selected_agent -- {selected_agent_name}")
-            selected_agent = self.agent_map.get(selected_agent_name, None)
-            if selected_agent == _DONE_AGENT:
+        # The step count is local to this invocation: the agent instance is
+        # shared by every concurrent session.
+        step = 0
+        while step < _MAX_ITERATIONS:
+            step += 1
+
+            logger.info("Step %d: selected_agent -- %s", step, selected_agent_name)
+            if selected_agent_name == _DONE_AGENT:
                 # We are done.
-                logger.info("Final state: {session_state}")
+                logger.info("Final state: %s", session_state)
                 return
 
-            if not selected_agent:
-                logger.error(f"ERROR: Unknown agent name: {selected_agent_name}")
+            selected_agent = self.agent_map.get(selected_agent_name)
+            if selected_agent is None:
+                logger.error("ERROR: Unknown agent name: %s", selected_agent_name)
                 return
-                                 
+
             async for event in selected_agent.run_async(ctx):
                 yield event
             next_agent = self.get_next_agent(session_state)
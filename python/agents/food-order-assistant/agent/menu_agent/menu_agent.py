@@ -14,7 +14,6 @@
 
 
 import re
-import yaml
 
 from decimal import Decimal
 from typing import Any, Union
@@ -25,32 +24,40 @@ from google.adk.models.base_llm import BaseLlm
 from google.adk.models.llm_request import LlmRequest
 from google.adk.models.llm_response import LlmResponse
 from google.adk.planners.built_in_planner import BuiltInPlanner
+from google.adk.sessions.state import State
 from google.genai import types
-from pydantic import BaseModel, ConfigDict, Field
+from pydantic import BaseModel, ConfigDict, Field, TypeAdapter
 
-from .. import constants
+from .. import callback_utils, constants
 
 import logging
 
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-_MENU = """
-name: Fresh Burger
+# The format can be "command [item1, item2, ...]" and can be repeated.
+# e.g. "add [Mini Burger] remove [King Burger]"
+_ORDER_UPDATE_PATTERN = re.compile(r'(\w+)\s+\[([^\]]*)\]')
+
+_NO_PRICE = Decimal(0)
+
+_MENU_NAME = "Fresh Burger"
+
+# Menu item name -> price. The menu shown to the model is rendered from it.
+_PRICE_MAP = {
+    "King Burger": Decimal("9.99"),
+    "Mini Burger": Decimal("7.99"),
+    "French Fries": Decimal("2.99"),
+    "Onion Rings": Decimal("3.99"),
+    "Large Fountain Drink": Decimal("3.99"),
+    "Medium Fountain Drink": Decimal("2.99"),
+}
+
+_MENU = f"""
+name: {_MENU_NAME}
 items:
-    - name: King Burger
-      price: $9.99
-    - name: Mini Burger
-      price: $7.99
-    - name: French Fries
-      price: $2.99
-    - name: Onion Rings
-      price: $3.99
-    - name: Large Fountain Drink
-      price: $3.99
-    - name: Medium Fountain Drink
-      price: $2.99
-"""
+""" + "".join(
+    f"    - name: {name}\n      price: ${price}\n"
+    for name, price in _PRICE_MAP.items())
 
 _AGENT_PROMPT = """
 You are an agent who takes food orders from the customer at a restaurant.
@@ -67,11 +74,6 @@ You are an agent who takes food orders from the customer at a restaurant.
 # MENU
 {_MENU}
 
-# ORDER
-[{{current_order?}}]
-
-# ORDER_STATUS: {{order_status?}}
-
 # Examples
 ## The customer ordering burger.
 CUSTOMER: Can I have a King burger?
@@ -122,6 +124,15 @@ AGENT: {{
 }}
 """
 
+# The only part of the prompt that depends on the session state. It is sent
+# after the static prompt so that the static prefix stays cacheable.
+_ORDER_PROMPT = """
+# ORDER
+[{current_order?}]
+
+# ORDER_STATUS: {order_status?}
+"""
+
 class OutputSchema(BaseModel):
   """Output schema for the agent."""
   agent_response: str = Field(description="Assistant response to the user")
@@ -129,99 +140,91 @@ class OutputSchema(BaseModel):
   order_finished: bool = Field(description="True if the user has finished placing their order. False otherwise.", default=False)
 
 
-class FoodItem(BaseModel):
-  """Represents a food item with its details."""
-  name: str
-  price: str = "$0.00"
+_OUTPUT_ADAPTER = TypeAdapter(OutputSchema)
 
 
-class Menu(BaseModel):
-  name: str
-  items: list[FoodItem]
+_STATIC_INSTRUCTION = types.Content(
+    role='user',
+    parts=[types.Part(text=_AGENT_PROMPT.format(_MENU=_MENU))],
+)
 
 
 class AfterModelCallback:
-  def __init__(self, agent: Any, price_map: dict):
-    self.agent = agent
-    self.price_map = price_map
+  def __init__(self):
+    self.streamer = callback_utils.AgentResponseStreamer()
 
   def __call__(
     self,
     callback_context: CallbackContext,
     llm_response: LlmResponse,
   ):
-    output = OutputSchema.model_validate_json(llm_response.content.parts[0].text)
-    logger.info(f"Model output: {output}")
+    if llm_response.partial:
+      return self.streamer(callback_context, llm_response)
+    self.streamer.finish(callback_context)
+
+    text = callback_utils.response_text(llm_response)
+    if not text:
+      return llm_response
+    output = _OUTPUT_ADAPTER.validate_json(text)
+    logger.info("Model output: %s", output)
 
     state = callback_context.state
-    if output.order_finished:
-      state[constants.ORDER_STATUS] = constants.FINISHED
-    else:
-      state[constants.ORDER_STATUS] = constants.IN_PROGRESS
-    self.update_order(output.order_update, state)
+    state_delta = {
+        constants.ORDER_STATUS: (
+            constants.FINISHED if output.order_finished
+            else constants.IN_PROGRESS),
+    }
+    state_delta.update(self.update_order(output.order_update, state))
+    state.update(state_delta)
 
     if output.order_finished:
       # Don't respond if the user is done ordering.
-      llm_response.content = types.Content(
-          role='model',
-          parts=[types.Part(text="")],
-      )
+      llm_response.content = callback_utils.model_content("")
     else:
-      llm_response.content = types.Content(
-          role='model',
-          parts=[types.Part(text=output.agent_response)],
-      )
+      llm_response.content = callback_utils.model_content(output.agent_response)
 
     return llm_response
 
-  def update_order(self, order_update: str, state: dict):
+  def update_order(self, order_update: str, state: State) -> dict[str, Any]:
+    """Returns the state changes that apply order_update to the order."""
     if not order_update:
-      return
+      return {}
 
-    if constants.CURRENT_ORDER not in state:
-        state[constants.CURRENT_ORDER] = []
-    if constants.ORDER_TOTAL not in state:
-        state[constants.ORDER_TOTAL] = 0.0
+    # Work on a copy so the session's list only changes through the delta.
+    current_order = list(state.get(constants.CURRENT_ORDER, []))
+    # The total is kept as a decimal string: exact, and JSON serializable for
+    # the session storage. Sessions stored before hold a float, which str()
+    # turns into its shortest repr rather than its binary expansion.
+    order_total = Decimal(str(state.get(constants.ORDER_TOTAL, "0")))
 
-    current_order = state[constants.CURRENT_ORDER]
-    order_total = Decimal(str(state[constants.ORDER_TOTAL]))
-
-    # The format can be "command [item1, item2, ...]" and can be repeated.
-    # e.g. "add [Mini Burger] remove [King Burger]"
-    command_blocks = re.findall(r'(\w+)\s+\[([^\]]*)\]', order_update)
-
-    for command, items_str in command_blocks:
-      items = [item.strip() for item in items_str.split(',') if item.strip()]
+    for command, items_str in _ORDER_UPDATE_PATTERN.findall(order_update):
+      items = [item for item in map(str.strip, items_str.split(',')) if item]
       if command == "add":
         current_order.extend(items)
         for item in items:
-          order_total += self.price_map.get(item, Decimal(0))
+          order_total += _PRICE_MAP.get(item, _NO_PRICE)
       elif command == "remove":
         for item_to_remove in items:
           try:
             current_order.remove(item_to_remove)
-            order_total -= self.price_map.get(item_to_remove, Decimal(0))
+            order_total -= _PRICE_MAP.get(item_to_remove, _NO_PRICE)
           except ValueError:
             logger.warning(
                 "Attempted to remove item '%s' which is not in the order.",
                 item_to_remove)
-    
-    state[constants.CURRENT_ORDER] = current_order
-    state[constants.ORDER_TOTAL] = float(order_total)
+
+    return {
+        constants.CURRENT_ORDER: current_order,
+        constants.ORDER_TOTAL: str(order_total),
+    }
+
+
+_after_model_callback = AfterModelCallback()
 
 
 class MenuAgent(LlmAgent):
 
   def __init__(self, model: Union[str, BaseLlm], **kwargs):
-    # Build a price map.
-    data = yaml.safe_load(_MENU)
-    menu = Menu.model_validate(data)
-    price_map = {}
-    for item in menu.items:
-      if item.price: # Check if price is not None or empty
-        price_map[item.name] = Decimal(item.price.strip('$'))
-
-    prompt = _AGENT_PROMPT.format(_MENU=_MENU)
     super().__init__(
       model=model,
       name='menu_agent',
@@ -231,8 +234,10 @@ class MenuAgent(LlmAgent):
             include_thoughts=False
           )
       ),
-      instruction=prompt,
-      after_model_callback=AfterModelCallback(agent=self, price_map=price_map),
+      static_instruction=_STATIC_INSTRUCTION,
+      instruction=_ORDER_PROMPT,
+      before_model_callback=callback_utils.trim_history,
+      after_model_callback=_after_model_callback,
       output_schema=OutputSchema,
       disallow_transfer_to_parent=True,
       disallow_transfer_to_peers=True,
@@ -13,10 +13,14 @@
 # limitations under the License.
 
 
+import asyncio
 import logging
 import os
+import weakref
 
-from google.genai import Client
+from google.adk.models.google_llm import Gemini
+from google.genai import Client, types
+from pydantic import PrivateAttr
 
 from typing import Any
 
@@ -27,22 +31,49 @@ from .preorder_agent import preorder_agent as preorder_agent
 from .user_info_agent import user_info_agent
 
 
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+_MENU_AGENT_STATUSES = frozenset(['UNKNOWN', constants.IN_PROGRESS])
+_CONFIRMATION_AGENT_STATUSES = frozenset([constants.FINISHED, constants.CONFIRMING])
+
+
+class _LoopLocalGemini(Gemini):
+    """
+    Gemini model that keeps one API client per event loop.
+
+    The client's async connection pool is bound to the loop it was first used
+    on. adk web runs every turn on one loop, but AdkApp runs each query in a new
+    thread with its own asyncio.run, where a shared client would reuse
+    connections of an already closed loop.
+    """
+
+    _clients: weakref.WeakKeyDictionary = PrivateAttr(
+        default_factory=weakref.WeakKeyDictionary)
+
+    @property
+    def api_client(self) -> Client:
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return Gemini.api_client.func(self)
+        client = self._clients.get(loop)
+        if client is None:
+            client = self._clients[loop] = Gemini.api_client.func(self)
+        return client
+
 
 def get_next_agent(session_state: dict[str, Any]) -> str:
     """
     Determines the next agent to run based on the session state.
     """
-    logger.info(f"State: {session_state}")
+    logger.info("State: %s", session_state)
 
     if session_state.get(constants.ORDER_TYPE, "UNKNOWN") == "UNKNOWN":
         return constants.PREORDER_AGENT
     order_status = session_state.get(constants.ORDER_STATUS, "UNKNOWN")
-    if order_status in set(['UNKNOWN', constants.IN_PROGRESS]):
+    if order_status in _MENU_AGENT_STATUSES:
         return constants.MENU_AGENT
-    if order_status == constants.FINISHED:
+    if order_status in _CONFIRMATION_AGENT_STATUSES:
         return constants.CONFIRMATION_AGENT
     if order_status == constants.CONFIRMED and not session_state.get(constants.NAME_FOR_ORDER, None):
         return constants.USER_INFO_AGENT
@@ -51,25 +82,67 @@ def get_next_agent(session_state: dict[str, Any]) -> str:
     return constants.DONE
 
 
+async def _warmup_llm(llm: Gemini):
+    await llm.api_client.aio.models.generate_content(
+        model=llm.model,
+        contents="ping",
+        config=types.GenerateContentConfig(
+            max_output_tokens=1,
+            thinking_config=types.ThinkingConfig(thinking_budget=0),
+        ),
+    )
+
+
+async def warmup(agent: custom_workflow_agent.CustomWorkflowAgent):
+    """
+    Sends a minimal request through each distinct model of the workflow, so
+    that credentials and connections are set up before the first user turn.
+    """
+    llms = {}
+    for sub_agent in agent.agent_map.values():
+        llm = sub_agent.canonical_model
+        if isinstance(llm, Gemini):
+            llms[id(llm)] = llm
+
+    results = await asyncio.gather(
+        *(_warmup_llm(llm) for llm in llms.values()), return_exceptions=True)
+    for llm, result in zip(llms.values(), results):
+        if isinstance(result, Exception):
+            logger.warning("Warmup for %s failed: %s", llm.model, result)
+        else:
+            logger.info("Warmed up %s", llm.model)
+
+
 def create_agent(genai_client: Client):
     # Update models as needed.
-    preorder_agent_model = "gemini-2.5-flash"
+    # The preorder and confirmation agents only classify short answers, so
+    # they run on the lighter, lower-latency model.
+    preorder_agent_model = "gemini-2.5-flash-lite"
     menu_agent_model = "gemini-2.5-flash"
-    confirmation_agent_model = "gemini-2.5-flash"
+    confirmation_agent_model = "gemini-2.5-flash-lite"
     user_info_agent_model = "gemini-2.5-flash"
 
-    logger.info(f"## preorder_agent: {preorder_agent_model}")
-    logger.info(f"## menu_agent: {menu_agent_model}")
-    logger.info(f"## confirmation_agent: {confirmation_agent_model}")
-    logger.info(f"## user_info_agent: {user_info_agent_model}")
+    logger.info("## preorder_agent: %s", preorder_agent_model)
+    logger.info("## menu_agent: %s", menu_agent_model)
+    logger.info("## confirmation_agent: %s", confirmation_agent_model)
+    logger.info("## user_info_agent: %s", user_info_agent_model)
+
+    # ADK creates a new Gemini client for every call when an agent's model is
+    # a string. Sharing one Gemini instance per model keeps its API client and
+    # connection pool alive across the turns that run on the same event loop.
+    llms = {
+        model: _LoopLocalGemini(model=model)
+        for model in (preorder_agent_model, menu_agent_model,
+                      confirmation_agent_model, user_info_agent_model)
+    }
 
     return custom_workflow_agent.CustomWorkflowAgent(
         name="OrderFlowAgent",
         agent_map = {
-            "preorder_agent": preorder_agent.create_agent(preorder_agent_model),
-            "menu_agent": menu_agent.create_agent(menu_agent_model),
-            "confirmation_agent": confirmation_agent.create_agent(confirmation_agent_model),
-            "user_info_agent": user_info_agent.create_agent(user_info_agent_model),
+            "preorder_agent": preorder_agent.create_agent(llms[preorder_agent_model]),
+            "menu_agent": menu_agent.create_agent(llms[menu_agent_model]),
+            "confirmation_agent": confirmation_agent.create_agent(llms[confirmation_agent_model]),
+            "user_info_agent": user_info_agent.create_agent(llms[user_info_agent_model]),
         },
         get_next_agent=get_next_agent,
     )
\ No newline at end of file
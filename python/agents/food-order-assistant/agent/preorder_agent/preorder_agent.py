@@ -12,8 +12,10 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import re
+
 from enum import Enum
-from typing import Any, Union
+from typing import Optional, Union
 
 from google.adk.agents.callback_context import CallbackContext
 from google.adk.agents import LlmAgent
@@ -23,15 +25,22 @@ from google.adk.models.llm_request import LlmRequest
 from google.adk.models.llm_response import LlmResponse
 from google.adk.planners.built_in_planner import BuiltInPlanner
 from google.genai import types, Client
-from pydantic import BaseModel, ConfigDict, Field
+from pydantic import BaseModel, ConfigDict, Field, TypeAdapter
 
-from .. import constants
+from .. import callback_utils, constants
 
 import logging
 
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Whole-message answers to the to-go/for-here question that need no model.
+_TO_GO_PATTERN = re.compile(
+    r"(to[- ]?go|take[- ]?out|take[- ]?away)( order)?,?( please)?[.!]*",
+    re.IGNORECASE)
+_FOR_HERE_PATTERN = re.compile(
+    r"(for here|here|dine[- ]in|eat[- ]in)( order)?,?( please)?[.!]*",
+    re.IGNORECASE)
+
 class OrderType(Enum):
   TO_GO = "to-go order"
   FOR_HERE = "for-here order"
@@ -45,28 +54,59 @@ class OutputSchema(BaseModel):
   user_started_order: bool = Field(description="True, if the user started to order. False otherwise")
 
 
+_OUTPUT_ADAPTER = TypeAdapter(OutputSchema)
+
+
+class BeforeModelCallback:
+  def __call__(
+    self,
+    callback_context: CallbackContext,
+    llm_request: LlmRequest,
+  ) -> Optional[LlmResponse]:
+    """Handles plain to-go/for-here answers."""
+    text = callback_utils.user_text(callback_context)
+    if _TO_GO_PATTERN.fullmatch(text):
+      order_type = OrderType.TO_GO
+    elif _FOR_HERE_PATTERN.fullmatch(text):
+      order_type = OrderType.FOR_HERE
+    else:
+      return None
+    callback_context.state[constants.ORDER_TYPE] = order_type.name
+    llm_response = LlmResponse()
+    llm_response.content = callback_utils.model_content("")
+    return llm_response
+
+
 class AfterModelCallback:
-  def __init__(self, agent: Any):
-    self.agent = agent
+  def __init__(self):
+    self.streamer = callback_utils.AgentResponseStreamer()
 
   def __call__(
     self,
     callback_context: CallbackContext,
     llm_response: LlmResponse,
   ):
-    output = OutputSchema.model_validate_json(llm_response.content.parts[0].text)
-    logger.info(f"Model output: {output}")
+    if llm_response.partial:
+      return self.streamer(callback_context, llm_response)
+    self.streamer.finish(callback_context)
+
+    text = callback_utils.response_text(llm_response)
+    if not text:
+      return llm_response
+    output = _OUTPUT_ADAPTER.validate_json(text)
+    logger.info("Model output: %s", output)
 
     if output.order_type != OrderType.UNKNOWN:
       callback_context.state[constants.ORDER_TYPE] = output.order_type.name
 
-    llm_response.content = types.Content(
-        role='model',
-        parts=[types.Part(text=output.agent_response)],
-    )
+    llm_response.content = callback_utils.model_content(output.agent_response)
     return llm_response
 
 
+_before_model_callback = BeforeModelCallback()
+_after_model_callback = AfterModelCallback()
+
+
 class PreorderAgent(LlmAgent):
 
   def __init__(self, model: Union[str, BaseLlm], **kwargs):
@@ -79,15 +119,19 @@ class PreorderAgent(LlmAgent):
           )
       ),
       name='preorder_agent',
-      instruction="""
-        You are an agent to ask the customer if the order is for to-go or for here.
-        If the user answers, populate the order_type field in the response and an empty agent_response.
-        If the user doesn't answer, politely ask the user to answer the to-go/for-here question.
-      """,
+      static_instruction=types.Content(
+          role='user',
+          parts=[types.Part(text="""
+            You are an agent to ask the customer if the order is for to-go or for here.
+            If the user answers, populate the order_type field in the response and an empty agent_response.
+            If the user doesn't answer, politely ask the user to answer the to-go/for-here question.
+          """)],
+      ),
       output_schema=OutputSchema,
       disallow_transfer_to_parent=True,
       disallow_transfer_to_peers=True,
-      after_model_callback=AfterModelCallback(agent=self),
+      before_model_callback=[_before_model_callback, callback_utils.trim_history],
+      after_model_callback=_after_model_callback,
     )
 
 
@@ -13,7 +13,7 @@
 # limitations under the License.
 
 
-from typing import Any, Optional, Union
+from typing import Optional, Union
 
 from google.adk.agents.callback_context import CallbackContext
 from google.adk.agents import LlmAgent
@@ -22,13 +22,12 @@ from google.adk.models.llm_request import LlmRequest
 from google.adk.models.llm_response import LlmResponse
 from google.adk.planners.built_in_planner import BuiltInPlanner
 from google.genai import types
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, TypeAdapter
 
-from .. import constants
+from .. import callback_utils, constants
 
 import logging
 
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
@@ -39,10 +38,10 @@ class OutputSchema(BaseModel):
   requires_order_update: bool = Field(description="True if the user needs to update their order. False otherwise.")
 
 
-class BeforeModelCallback:
-  def __init__(self, agent):
-    self.agent = agent
+_OUTPUT_ADAPTER = TypeAdapter(OutputSchema)
+
 
+class BeforeModelCallback:
   def __call__(
     self,
     callback_context: CallbackContext,
@@ -50,46 +49,53 @@ class BeforeModelCallback:
   ) -> Optional[LlmResponse]:
     """Asks for the user's name if not provided."""
     state = callback_context.state
-    if state[constants.ORDER_STATUS] == constants.CONFIRMED:
+    if state.get(constants.ORDER_STATUS) == constants.CONFIRMED:
       if state.get(constants.NAME_FOR_ORDER, None):
         agent_response = f"Alright, {state[constants.NAME_FOR_ORDER]}! Give me one second as I place the order."
       else:
         agent_response = "Can I have a name for this order, please?"
         state[constants.ORDER_STATUS] = constants.GETTING_USER_INFO
       llm_response = LlmResponse()
-      llm_response.content = types.Content(
-          role='model',
-          parts=[types.Part(text=agent_response)],
-      )
+      llm_response.content = callback_utils.model_content(agent_response)
       return llm_response
     return None
 
 
 class AfterModelCallback:
-  def __init__(self, agent: Any):
-    self.agent = agent
+  def __init__(self):
+    self.streamer = callback_utils.AgentResponseStreamer()
 
   def __call__(
     self,
     callback_context: CallbackContext,
     llm_response: LlmResponse,
   ):
-    output = OutputSchema.model_validate_json(llm_response.content.parts[0].text)
+    if llm_response.partial:
+      return self.streamer(callback_context, llm_response)
+    self.streamer.finish(callback_context)
+
+    text = callback_utils.response_text(llm_response)
+    if not text:
+      return llm_response
+    output = _OUTPUT_ADAPTER.validate_json(text)
 
     state = callback_context.state
     if output.requires_order_update:
       state[constants.ORDER_STATUS] = constants.IN_PROGRESS
       output.agent_response = ""
     else:
+      # The status stays GETTING_USER_INFO, so later turns keep coming back
+      # here and the user can still go back to change the order.
       state[constants.NAME_FOR_ORDER] = output.name_for_order
 
-    llm_response.content = types.Content(
-        role='model',
-        parts=[types.Part(text=output.agent_response)],
-    )
+    llm_response.content = callback_utils.model_content(output.agent_response)
     return llm_response
 
 
+_before_model_callback = BeforeModelCallback()
+_after_model_callback = AfterModelCallback()
+
+
 class UserInfoAgent(LlmAgent):
 
   def __init__(self, model: Union[str, BaseLlm], **kwargs):
@@ -102,36 +108,40 @@ class UserInfoAgent(LlmAgent):
           )
       ),
       name='user_info_agent',
+      static_instruction=types.Content(
+          role='user',
+          parts=[types.Part(text="""
+            You are an assistant to get the user name.
+            If the order status is CONFIRMED, and you don't know the user name, ask the user for their name.
+            Once the user provides their name, respond with "Alright, <their name>! Give me one second as I place the order." and populate the name_for_order field in the response.
+
+            <example>
+              Assistant: Can I have a name for this order, please?
+              User: john
+              Output: {"agent_response": "Alright, john! Give me one second as I place the order.", "name_for_user": "john", "requires_order_update": false}
+            </example>
+            <example>
+              Assistant: Can I have a name for this order, please?
+              User: Oh, actually, can I remove the shake?
+              Output: {"agent_response": "", "name_for_user": "", "requires_order_update": true})
+            </example>
+            <example>
+              Assistant: Can I have a name for this order, please?
+              User: david, by the way, can I remove the shake?
+              Output: {"agent_response": "", "name_for_user": "david", "requires_order_update": true})
+            </example>
+
+            Do not speak about the agent transfer.
+          """)],
+      ),
       instruction="""
-        You are an assistant to get the user name.
-        If the order status is CONFIRMED, and you don't know the user name, ask the user for their name.
-        Once the user provides their name, respond with "Alright, <their name>! Give me one second as I place the order." and populate the name_for_order field in the response.
-        
         order status: {order_status?}
-
-        <example>
-          Assistant: Can I have a name for this order, please?
-          User: john
-          Output: {"agent_response": "Alright, john! Give me one second as I place the order.", "name_for_user": "john", "requires_order_update": false}
-        </example>
-        <example>
-          Assistant: Can I have a name for this order, please?
-          User: Oh, actually, can I remove the shake?
-          Output: {"agent_response": "", "name_for_user": "", "requires_order_update": true})
-        </example>
-        <example>
-          Assistant: Can I have a name for this order, please?
-          User: david, by the way, can I remove the shake?
-          Output: {"agent_response": "", "name_for_user": "david", "requires_order_update": true})
-        </example>
-
-        Do not speak about the agent transfer.
       """,
       output_schema=OutputSchema,
       disallow_transfer_to_parent=True,
       disallow_transfer_to_peers=True,
-      before_model_callback=BeforeModelCallback(agent=self),
-      after_model_callback=AfterModelCallback(agent=self),
+      before_model_callback=[_before_model_callback, callback_utils.trim_history],
+      after_model_callback=_after_model_callback,
   )
 
 
@@ -0,0 +1,52 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+
+import pytest
+
+# Importing the agent package builds the root agent, which reads these. The
+# unit tests never call the model, so any project and location will do.
+os.environ.setdefault("GOOGLE_CLOUD_PROJECT", "test-project")
+os.environ.setdefault("GOOGLE_CLOUD_LOCATION", "us-central1")
+os.environ.setdefault("GOOGLE_GENAI_USE_VERTEXAI", "1")
+
+from google.adk.agents import LlmAgent
+from google.adk.agents.callback_context import CallbackContext
+from google.adk.agents.invocation_context import InvocationContext
+from google.adk.sessions import InMemorySessionService, Session
+from google.genai import types
+
+
+@pytest.fixture
+def make_callback_context():
+  """Returns a factory for callback contexts of a fresh session."""
+
+  def make(user_text="", state=None, invocation_id="test-invocation"):
+    invocation_context = InvocationContext(
+        session_service=InMemorySessionService(),
+        invocation_id=invocation_id,
+        agent=LlmAgent(name="test_agent"),
+        user_content=types.Content(
+            role="user", parts=[types.Part(text=user_text)]),
+        session=Session(
+            id="test-session",
+            app_name="test-app",
+            user_id="test-user",
+            state=dict(state or {}),
+        ),
+    )
+    return CallbackContext(invocation_context)
+
+  return make
@@ -0,0 +1,430 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+import json
+
+import pytest
+from google.adk.agents import LlmAgent
+from google.adk.models.base_llm import BaseLlm
+from google.adk.models.llm_request import LlmRequest
+from google.adk.models.llm_response import LlmResponse
+from google.adk.runners import InMemoryRunner
+from google.adk.sessions.state import State
+from google.genai import types
+from pydantic import Field
+
+from agent import constants, custom_workflow_agent, order_flow_agent
+from agent.confirmation_agent import confirmation_agent
+from agent.menu_agent import menu_agent
+from agent.preorder_agent import preorder_agent
+
+
+class _ScriptedLlm(BaseLlm):
+  """Returns the scripted outputs in order instead of calling Gemini."""
+
+  outputs: list[dict] = Field(default_factory=list)
+
+  async def generate_content_async(self, llm_request, stream=False):
+    output = self.outputs.pop(0) if self.outputs else {}
+    yield LlmResponse(content=types.ModelContent(
+        parts=[types.Part(text=json.dumps(output))]))
+
+
+def _run_turns(session_state, turns):
+  """Runs the order workflow on (user text, model outputs) turns.
+
+  Returns the reply of every turn and the final session state.
+  """
+
+  async def run():
+    root_agent = order_flow_agent.create_agent(genai_client=None)
+    llm = _ScriptedLlm(model="scripted")
+    for agent in root_agent.agent_map.values():
+      agent.model = llm
+    runner = InMemoryRunner(agent=root_agent, app_name="test-app")
+    session = await runner.session_service.create_session(
+        app_name="test-app", user_id="test-user", state=session_state)
+
+    replies = []
+    for text, outputs in turns:
+      llm.outputs.extend(outputs)
+      reply = ""
+      async for event in runner.run_async(
+          user_id="test-user",
+          session_id=session.id,
+          new_message=types.UserContent(parts=[types.Part(text=text)])):
+        if event.content and event.content.parts:
+          reply += "".join(part.text for part in event.content.parts if part.text)
+      replies.append(reply)
+      # Every scripted model output was used, and no model call was unscripted.
+      assert not llm.outputs
+
+    session = await runner.session_service.get_session(
+        app_name="test-app", user_id="test-user", session_id=session.id)
+    return replies, session.state
+
+  return asyncio.run(run())
+
+
+@pytest.mark.parametrize("text, order_type", [
+    ("to go", "TO_GO"),
+    ("To-go, please.", "TO_GO"),
+    ("takeout", "TO_GO"),
+    ("take away order please!", "TO_GO"),
+    ("for here", "FOR_HERE"),
+    ("here please", "FOR_HERE"),
+    ("Dine-in.", "FOR_HERE"),
+    ("eat in, please", "FOR_HERE"),
+])
+def test_preorder_fast_path_sets_order_type(
+    make_callback_context, text, order_type):
+  callback_context = make_callback_context(text)
+
+  llm_response = preorder_agent.BeforeModelCallback()(
+      callback_context, LlmRequest())
+
+  assert llm_response is not None
+  assert llm_response.content.parts[0].text == ""
+  assert callback_context.state[constants.ORDER_TYPE] == order_type
+
+
+@pytest.mark.parametrize("text", [
+    "",
+    "hi",
+    "to go with a burger",
+    "I'd like it for here",
+    "not here",
+    "here or to go?",
+])
+def test_preorder_fast_path_leaves_other_messages_to_the_model(
+    make_callback_context, text):
+  callback_context = make_callback_context(text)
+
+  llm_response = preorder_agent.BeforeModelCallback()(
+      callback_context, LlmRequest())
+
+  assert llm_response is None
+  assert constants.ORDER_TYPE not in callback_context.state
+
+
+@pytest.mark.parametrize("text, order_status", [
+    ("yes", constants.CONFIRMED),
+    ("Yes, please.", constants.CONFIRMED),
+    ("yep!", constants.CONFIRMED),
+    ("correct", constants.CONFIRMED),
+    ("That's it, thanks", constants.CONFIRMED),
+    ("that’s all", constants.CONFIRMED),
+    ("no", constants.IN_PROGRESS),
+    ("Nope.", constants.IN_PROGRESS),
+])
+def test_confirmation_fast_path_sets_order_status(
+    make_callback_context, text, order_status):
+  callback_context = make_callback_context(
+      text, state={constants.ORDER_STATUS: constants.CONFIRMING})
+
+  llm_response = confirmation_agent.BeforeModelCallback()(
+      callback_context, LlmRequest())
+
+  assert llm_response is not None
+  assert llm_response.content.parts[0].text == ""
+  assert callback_context.state[constants.ORDER_STATUS] == order_status
+
+
+@pytest.mark.parametrize("text", [
+    "",
+    "yes, add fries",
+    "No thanks",
+    "no, remove the soda",
+    "yes and a coke",
+    "what's the total?",
+])
+def test_confirmation_fast_path_leaves_other_messages_to_the_model(
+    make_callback_context, text):
+  callback_context = make_callback_context(
+      text, state={constants.ORDER_STATUS: constants.CONFIRMING})
+
+  llm_response = confirmation_agent.BeforeModelCallback()(
+      callback_context, LlmRequest())
+
+  assert llm_response is None
+  assert callback_context.state[constants.ORDER_STATUS] == constants.CONFIRMING
+
+
+@pytest.mark.parametrize("order_status", [
+    None,
+    constants.IN_PROGRESS,
+    constants.FINISHED,
+])
+def test_confirmation_fast_path_needs_the_summary_first(
+    make_callback_context, order_status):
+  state = {}
+  if order_status is not None:
+    state[constants.ORDER_STATUS] = order_status
+  callback_context = make_callback_context("yes", state=state)
+
+  llm_response = confirmation_agent.BeforeModelCallback()(
+      callback_context, LlmRequest())
+
+  assert llm_response is None
+  assert callback_context.state.get(constants.ORDER_STATUS) == order_status
+
+
+@pytest.mark.parametrize("session_state, next_agent", [
+    ({}, constants.PREORDER_AGENT),
+    ({constants.ORDER_TYPE: "UNKNOWN"}, constants.PREORDER_AGENT),
+    ({constants.ORDER_TYPE: "TO_GO"}, constants.MENU_AGENT),
+    ({constants.ORDER_TYPE: "TO_GO",
+      constants.ORDER_STATUS: constants.IN_PROGRESS}, constants.MENU_AGENT),
+    ({constants.ORDER_TYPE: "TO_GO",
+      constants.ORDER_STATUS: constants.FINISHED},
+     constants.CONFIRMATION_AGENT),
+    ({constants.ORDER_TYPE: "TO_GO",
+      constants.ORDER_STATUS: constants.CONFIRMING},
+     constants.CONFIRMATION_AGENT),
+    ({constants.ORDER_TYPE: "TO_GO",
+      constants.ORDER_STATUS: constants.CONFIRMED},
+     constants.USER_INFO_AGENT),
+    ({constants.ORDER_TYPE: "TO_GO",
+      constants.ORDER_STATUS: constants.GETTING_USER_INFO},
+     constants.USER_INFO_AGENT),
+    ({constants.ORDER_TYPE: "TO_GO",
+      constants.ORDER_STATUS: constants.CONFIRMED,
+      constants.NAME_FOR_ORDER: "Sam"}, constants.DONE),
+])
+def test_get_next_agent(session_state, next_agent):
+  assert order_flow_agent.get_next_agent(session_state) == next_agent
+
+
+def test_gemini_api_client_is_shared_per_event_loop():
+  root_agent = order_flow_agent.create_agent(genai_client=None)
+  llm = root_agent.agent_map[constants.MENU_AGENT].canonical_model
+
+  async def api_clients():
+    return llm.api_client, llm.api_client
+
+  first, first_again = asyncio.run(api_clients())
+  second, _ = asyncio.run(api_clients())
+
+  assert root_agent.agent_map[constants.USER_INFO_AGENT].canonical_model is llm
+  assert first is first_again
+  # Each asyncio.run has its own loop, and a client must not outlive its loop.
+  assert second is not first
+
+
+def test_order_can_change_after_the_name_is_given():
+  replies, state = _run_turns(
+      {
+          constants.ORDER_TYPE: "TO_GO",
+          constants.ORDER_STATUS: constants.CONFIRMED,
+          constants.CURRENT_ORDER: ["King Burger"],
+          constants.ORDER_TOTAL: "9.99",
+      },
+      [
+          ("That's all", []),
+          ("Sam", [{
+              "agent_response": "Thanks, Sam!",
+              "name_for_order": "Sam",
+              "requires_order_update": False,
+          }]),
+          ("Wait, can I add fries?", [
+              {
+                  "agent_response": "",
+                  "name_for_order": "Sam",
+                  "requires_order_update": True,
+              },
+              {
+                  "agent_response": "Added French Fries.",
+                  "order_update": "add [French Fries]",
+                  "order_finished": False,
+              },
+          ]),
+      ])
+
+  assert replies == [
+      "Can I have a name for this order, please?",
+      "Thanks, Sam!",
+      "Added French Fries.",
+  ]
+  assert state[constants.NAME_FOR_ORDER] == "Sam"
+  assert state[constants.ORDER_STATUS] == constants.IN_PROGRESS
+  assert state[constants.CURRENT_ORDER] == ["King Burger", "French Fries"]
+  assert state[constants.ORDER_TOTAL] == "12.98"
+
+
+@pytest.mark.parametrize("order_total", ["12.98", 12.98])
+def test_update_order_total_is_an_exact_string(order_total):
+  state = {
+      constants.CURRENT_ORDER: ["King Burger", "French Fries"],
+      constants.ORDER_TOTAL: order_total,
+  }
+
+  state_delta = menu_agent.AfterModelCallback().update_order(
+      "add [French Fries]", state)
+
+  assert state_delta[constants.ORDER_TOTAL] == "15.97"
+
+
+def _model_output(output):
+  return LlmResponse(content=types.ModelContent(
+      parts=[types.Part(text=json.dumps(output))]))
+
+
+def test_menu_callback_applies_the_order_in_one_state_update(
+    make_callback_context, monkeypatch):
+  callback_context = make_callback_context(state={
+      constants.CURRENT_ORDER: ["King Burger", "French Fries"],
+      constants.ORDER_TOTAL: "12.98",
+  })
+  session_order = callback_context.state[constants.CURRENT_ORDER]
+  updates = []
+
+  def set_item(self, key, value):
+    pytest.fail(f"{key} was set outside the single state update")
+
+  monkeypatch.setattr(State, "update", lambda self, delta: updates.append(delta))
+  monkeypatch.setattr(State, "__setitem__", set_item)
+
+  llm_response = menu_agent.AfterModelCallback()(
+      callback_context, _model_output({
+          "agent_response": "Anything else?",
+          "order_update": "remove [French Fries] add [Onion Rings, Medium Fountain Drink]",
+          "order_finished": False,
+      }))
+
+  assert llm_response.content.parts[0].text == "Anything else?"
+  assert updates == [{
+      constants.ORDER_STATUS: constants.IN_PROGRESS,
+      constants.CURRENT_ORDER: [
+          "King Burger", "Onion Rings", "Medium Fountain Drink"],
+      constants.ORDER_TOTAL: "16.97",
+  }]
+  # The session's list only changes through the delta.
+  assert session_order == ["King Burger", "French Fries"]
+
+
+def test_menu_callback_finishing_the_order(make_callback_context):
+  callback_context = make_callback_context(state={
+      constants.CURRENT_ORDER: ["King Burger"],
+      constants.ORDER_TOTAL: "9.99",
+  })
+
+  llm_response = menu_agent.AfterModelCallback()(
+      callback_context, _model_output({
+          "agent_response": "Great, let me read your order back.",
+          "order_update": "",
+          "order_finished": True,
+      }))
+
+  assert llm_response.content.parts[0].text == ""
+  assert callback_context.state[constants.ORDER_STATUS] == constants.FINISHED
+  assert callback_context.state[constants.CURRENT_ORDER] == ["King Burger"]
+  assert callback_context.state[constants.ORDER_TOTAL] == "9.99"
+
+
+def test_update_order_without_changes():
+  assert menu_agent.AfterModelCallback().update_order("", {}) == {}
+
+
+def test_update_order_starts_an_empty_order():
+  state_delta = menu_agent.AfterModelCallback().update_order(
+      "add [King Burger, French Fries, King Burger]", {})
+
+  assert state_delta == {
+      constants.CURRENT_ORDER: ["King Burger", "French Fries", "King Burger"],
+      constants.ORDER_TOTAL: "22.97",
+  }
+
+
+def test_update_order_ignores_items_not_in_the_order():
+  state = {
+      constants.CURRENT_ORDER: ["King Burger"],
+      constants.ORDER_TOTAL: "9.99",
+  }
+
+  state_delta = menu_agent.AfterModelCallback().update_order(
+      "remove [French Fries]", state)
+
+  assert state_delta == {
+      constants.CURRENT_ORDER: ["King Burger"],
+      constants.ORDER_TOTAL: "9.99",
+  }
+
+
+def _run_workflow(get_next_agent, invocations):
+  """Runs a CustomWorkflowAgent of two plain agents, "a" and "b".
+
+  Returns the authors of the events of every invocation.
+  """
+
+  async def run():
+    llm = _ScriptedLlm(model="scripted")
+    root_agent = custom_workflow_agent.CustomWorkflowAgent(
+        name="test_workflow",
+        agent_map={
+            "a": LlmAgent(name="a", model=llm),
+            "b": LlmAgent(name="b", model=llm),
+        },
+        get_next_agent=get_next_agent,
+    )
+    runner = InMemoryRunner(agent=root_agent, app_name="test-app")
+    authors = []
+    for _ in range(invocations):
+      session = await runner.session_service.create_session(
+          app_name="test-app", user_id="test-user")
+      authors.append([
+          event.author async for event in runner.run_async(
+              user_id="test-user",
+              session_id=session.id,
+              new_message=types.UserContent(parts=[types.Part(text="hi")]))
+      ])
+    return authors
+
+  return asyncio.run(run())
+
+
+def test_workflow_done_ends_the_invocation(caplog):
+  agents = iter(["a", "b", constants.DONE])
+
+  authors = _run_workflow(lambda session_state: next(agents), 1)
+
+  assert authors == [["a", "b"]]
+  assert not [r for r in caplog.records if r.levelname == "ERROR"]
+
+
+def test_workflow_done_without_running_an_agent(caplog):
+  authors = _run_workflow(lambda session_state: constants.DONE, 1)
+
+  assert authors == [[]]
+  assert not [r for r in caplog.records if r.levelname == "ERROR"]
+
+
+def test_workflow_unknown_agent_ends_the_invocation(caplog):
+  authors = _run_workflow(lambda session_state: "unknown_agent", 1)
+
+  assert authors == [[]]
+  assert "Unknown agent name: unknown_agent" in caplog.text
+
+
+def test_workflow_step_budget_is_per_invocation():
+  agents = iter(["a", "b"] * custom_workflow_agent._MAX_ITERATIONS * 2)
+
+  authors = _run_workflow(lambda session_state: next(agents), 2)
+
+  # Alternating agents never stop on their own, so each invocation runs
+  # until its own step budget is used up.
+  assert [len(events) for events in authors] == [
+      custom_workflow_agent._MAX_ITERATIONS,
+      custom_workflow_agent._MAX_ITERATIONS,
+  ]
@@ -0,0 +1,193 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import gc
+import json
+
+import pytest
+from google.adk.models.llm_request import LlmRequest
+from google.adk.models.llm_response import LlmResponse
+from google.genai import types
+
+from agent import callback_utils
+
+
+def _prefixes(text):
+  return [text[:i] for i in range(len(text) + 1)]
+
+
+def _partial(text):
+  return LlmResponse(
+      content=types.Content(role="model", parts=[types.Part(text=text)]),
+      partial=True,
+  )
+
+
+@pytest.mark.parametrize("agent_response", [
+    "Hello! What can I get you?",
+    'Say "cheese"\\and\nsmile\t!',
+    "Caf\u00e9 cr\u00e8me",
+    "Pizza \U0001F355 time",
+])
+def test_decode_agent_response_prefixes_only_grow(agent_response):
+  output = json.dumps({"agent_response": agent_response, "order_finished": False})
+
+  decoded = [callback_utils.decode_agent_response(p) for p in _prefixes(output)]
+
+  for previous, current in zip(decoded, decoded[1:]):
+    assert current.startswith(previous)
+  assert decoded[-1] == agent_response
+
+
+def test_decode_agent_response_decodes_escapes():
+  output = r'{"agent_response": "a\"b\\c\nd\u00e9\ud83c\udf55"}'
+
+  assert callback_utils.decode_agent_response(output) == 'a"b\\c\nd\u00e9\U0001F355'
+
+
+def test_decode_agent_response_without_value_yet():
+  assert callback_utils.decode_agent_response("") == ""
+  assert callback_utils.decode_agent_response('{"agent_resp') == ""
+  assert callback_utils.decode_agent_response('{"agent_response"') == ""
+  assert callback_utils.decode_agent_response('{"agent_response": ') == ""
+
+
+@pytest.mark.parametrize("output", [
+    '{"agent_response": "ab\\',
+    r'{"agent_response": "ab\u00',
+    r'{"agent_response": "ab\ud83c',
+    r'{"agent_response": "ab\ud83c\udf5',
+])
+def test_decode_agent_response_waits_for_truncated_escapes(output):
+  assert callback_utils.decode_agent_response(output) == "ab"
+
+
+def test_decode_agent_response_ignores_other_fields():
+  output = '{"order_update": "add \\"Fries\\"", "agent_response": "Sure'
+
+  assert callback_utils.decode_agent_response(output) == "Sure"
+
+
+@pytest.mark.parametrize("output", [
+    r'{"agent_response": "ab\x',
+    r'{"agent_response": "ab\uzzzz',
+])
+def test_decode_agent_response_raises_on_malformed_escapes(output):
+  with pytest.raises(ValueError):
+    callback_utils.decode_agent_response(output)
+
+
+def test_streamer_emits_new_agent_response_text(make_callback_context):
+  streamer = callback_utils.AgentResponseStreamer()
+  callback_context = make_callback_context()
+
+  emitted = [
+      streamer(callback_context, _partial(chunk)).content.parts[0].text
+      for chunk in ['{"agent_', 'response": "Hel', 'lo!", "order', '_type": 1}']
+  ]
+
+  assert emitted == ["", "Hel", "lo!", ""]
+
+
+def test_streamer_emits_nothing_for_malformed_escapes(make_callback_context):
+  streamer = callback_utils.AgentResponseStreamer()
+  callback_context = make_callback_context()
+
+  emitted = [
+      streamer(callback_context, _partial(chunk)).content.parts[0].text
+      for chunk in ['{"agent_response": "Hi', r' \x', 'there"}']
+  ]
+
+  assert emitted == ["Hi", "", ""]
+
+
+def test_streamer_finish_drops_the_buffer(make_callback_context):
+  streamer = callback_utils.AgentResponseStreamer()
+  callback_context = make_callback_context()
+  streamer(callback_context, _partial('{"agent_response": "Hi'))
+
+  streamer.finish(callback_context)
+
+  assert not streamer._buffers
+
+
+def test_streamer_drops_the_buffer_of_an_abandoned_stream(
+    make_callback_context):
+  streamer = callback_utils.AgentResponseStreamer()
+  callback_context = make_callback_context()
+  streamer(callback_context, _partial('{"agent_response": "Hi'))
+  assert streamer._buffers
+
+  # The stream ends without a final response, e.g. the client disconnected.
+  del callback_context
+  gc.collect()
+
+  assert not streamer._buffers
+
+
+def test_response_text_without_text():
+  assert callback_utils.response_text(LlmResponse()) == ""
+  assert callback_utils.response_text(
+      LlmResponse(content=types.Content(role="model", parts=[types.Part()]))
+  ) == ""
+
+
+def _llm_request(roles):
+  return LlmRequest(contents=[
+      types.Content(role=role, parts=[types.Part(text=f"{role} {i}")])
+      for i, role in enumerate(roles)
+  ])
+
+
+@pytest.mark.parametrize("pairs, kept", [
+    (9, 20),
+    (10, 12),
+    (15, 12),
+    (20, 12),
+])
+def test_trim_history_drops_contents_in_steps(
+    make_callback_context, pairs, kept):
+  # Earlier turns, then the current message and the per-turn instruction.
+  roles = ["user", "model"] * pairs + ["user", "user"]
+  llm_request = _llm_request(roles)
+  current_turn = llm_request.contents[-2:]
+
+  callback_utils.trim_history(make_callback_context(), llm_request)
+
+  assert len(llm_request.contents) == kept
+  assert llm_request.contents[0].role == "user"
+  assert llm_request.contents[-2:] == current_turn
+
+
+def test_trim_history_keeps_everything_after_the_last_model_content(
+    make_callback_context):
+  llm_request = _llm_request(["user", "user", "model"] + ["user"] * 20)
+
+  callback_utils.trim_history(make_callback_context(), llm_request)
+
+  assert len(llm_request.contents) == 20
+  assert llm_request.contents[0].parts[0].text == "user 3"
+
+
+@pytest.mark.parametrize("roles", [
+    ["user"] * 25,
+    ["user"] * 5 + ["model"] * 20,
+])
+def test_trim_history_without_a_user_content_to_start_from(
+    make_callback_context, roles):
+  llm_request = _llm_request(roles)
+
+  callback_utils.trim_history(make_callback_context(), llm_request)
+
+  assert len(llm_request.contents) == len(roles)